@@ -1,25 +1,79 @@
 # Importing flask module in the project is mandatory
 # An object of Flask class is our WSGI application.
-from flask import Flask, render_template, request, send_file
+import os
+import time
+from flask import Flask, Response, jsonify, render_template, request, send_file
 from main import parseargs
 
+from utils.drawable import load_font, warm_up
 from utils.map import WordMaze
+from utils.metrics import Counter, Gauge, Histogram, MetricsRegistry
+
+# Determine an arbitrary square Grid Width and Height
+GRID_SIZE = 25
+BLOCK_SIZE = 20
+GRID_LABEL = f"{GRID_SIZE}x{GRID_SIZE}"
+
+# Generation is random, a maze without enough junctions for the word usually works on a second go
+MAX_GENERATION_ATTEMPTS = 3
+
+# Parse the maze options once, requests never change them
+MAZE_ARGS, _ = parseargs([])
+
+# Load fonts before the workers fork so each one doesn't do it on its first request
+warm_up([BLOCK_SIZE])
+
+def get_static_bytes() -> int:
+    return sum(entry.stat().st_size for entry in os.scandir("static") if entry.is_file())
+
+METRICS = MetricsRegistry()
+PHASE_SECONDS = METRICS.register(Histogram("maze_phase_seconds", "Time spent in each phase of serving a maze.", ("phase", "grid")))
+REQUESTS = METRICS.register(Counter("maze_requests_total", "Maze requests received.", ("format",)))
+ERRORS = METRICS.register(Counter("maze_errors_total", "Maze generation failures by exception.", ("error",)))
+RETRIES = METRICS.register(Counter("maze_generation_retries_total", "Maze generations retried after a failure."))
+IN_FLIGHT = METRICS.register(Gauge("maze_in_flight", "Maze requests currently being generated.", ("format",)))
+METRICS.register(Gauge("maze_static_bytes", "Bytes used by files in static/.", callback=get_static_bytes))
+METRICS.register(Counter("maze_font_cache_hits_total", "Letter font cache hits.", callback=lambda: load_font.cache_info().hits))
+METRICS.register(Counter("maze_font_cache_misses_total", "Letter font cache misses.", callback=lambda: load_font.cache_info().misses))
 
 app = Flask(__name__)
 
+def build_maze(word: str, render: bool = True) -> WordMaze:
+    for attempt in range(MAX_GENERATION_ATTEMPTS):
+        start = time.perf_counter()
+        try:
+            maze = WordMaze(word, GRID_SIZE, GRID_SIZE, BLOCK_SIZE, BLOCK_SIZE, args=MAZE_ARGS, render=render)
+        except IndexError:
+            ERRORS.inc(error="IndexError")
+            if attempt == MAX_GENERATION_ATTEMPTS - 1:
+                raise
+            RETRIES.inc()
+        except ValueError:
+            ERRORS.inc(error="ValueError")
+            raise
+
+        # Only successful generations count towards latency, failures are in maze_errors_total
+        PHASE_SECONDS.observe(time.perf_counter() - start, phase="generate", grid=GRID_LABEL)
+        return maze
+
 def generate_maze(word: str) -> str:
-    # Determine an arbitrary square Grid Width and Height
-    grid_width = grid_height = 25
-    block_width = block_height = 20
     word = word.lower()
     # Generate the maze
-    maze = WordMaze(word, grid_width, grid_height, block_width, block_height, args=parseargs())
-    # Save the maze to a file
+    maze = build_maze(word)
+    # Save the maze and a small preview of it from the same render
     filename = f"static/{word}.png"
-    maze.save_image(filename)
+    with PHASE_SECONDS.time(phase="save", grid=GRID_LABEL):
+        maze.save_images({filename: 1, f"static/{word}_preview.png": 0.25})
     # Return where to find the maze
     return '/' + filename
 
+def generate_maze_structure(word: str, include_solution: bool = False) -> dict:
+    word = word.lower()
+    # Generate the maze without rendering any pixels, the client draws it
+    maze = build_maze(word, render=False)
+    with PHASE_SECONDS.time(phase="export", grid=GRID_LABEL):
+        return maze.to_structure(include_solution)
+
 @app.route('/')
 def index():
     return render_template("base.html")
@@ -31,10 +85,21 @@ def get_maze():
             return "Invalid Input"
 
         word = request.args.get('word')
+        response_format = 'json' if request.args.get('format') == 'json' else 'png'
+        REQUESTS.inc(format=response_format)
+
+        with IN_FLIGHT.track_in_progress(format=response_format), PHASE_SECONDS.time(phase="total", grid=GRID_LABEL):
+            if response_format == 'json':
+                include_solution = request.args.get('solution', '').lower() in ('1', 'true', 'yes')
+                return jsonify(generate_maze_structure(word, include_solution))
 
-        return generate_maze(word)
+            return generate_maze(word)
 
     return 'Nothing Here'
 
+@app.route('/metrics', methods=["GET"])
+def get_metrics():
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
@@ -1,7 +1,21 @@
+from utils.drawable import get_scale_factor
 from utils.map import WordMaze
 import argparse
+from contextlib import nullcontext
+from typing import Dict, List, Tuple
 
-def parseargs() -> argparse.Namespace:
+def parse_scale(value: str) -> float:
+    """argparse type for a resize scale written as a number or a fraction, e.g. 0.25, 2 or 1/3"""
+    try:
+        numerator, _, denominator = value.partition("/")
+        scale = float(numerator) / float(denominator) if denominator else float(numerator)
+        get_scale_factor(scale)
+    except (ValueError, ZeroDivisionError, OverflowError) as error:
+        raise argparse.ArgumentTypeError(f"invalid scale {value!r}: {error}")
+
+    return scale
+
+def parseargs(argv: List[str] = None) -> Tuple[argparse.Namespace, List[str]]:
     arg_parser = argparse.ArgumentParser()
 
     arg_parser.add_argument("--grid_width", help="The number of blocks wide to make the maze.", type=int, default=20)
@@ -16,30 +30,55 @@ def parseargs() -> argparse.Namespace:
     arg_parser.add_argument("--show_letter_placement", help="Save a GIF showing how the letters were placed.", action="store_true", default=False)
     arg_parser.add_argument("--filename", help="What to name the output maze.", type=str, default="Output_Maze.png")
     arg_parser.add_argument("--word", help="What word to guide the solver.", type=str, default="Hello")
+    arg_parser.add_argument("--preview_scale", help="Also save a copy of the maze resized by this scale, e.g. 0.25, 1/3 or 2.", type=parse_scale, default=None)
+    arg_parser.add_argument("--validate", help="Check each generated maze and report any problems found.", action="store_true", default=False)
+    arg_parser.add_argument("--archive", help="Write every maze and variant into this .zip, .tar or .tar.gz file with a manifest instead of separate files.", type=str, default=None)
+    arg_parser.add_argument("--band_rows", help="Render and save the maze this many block rows at a time to bound memory use, 0 renders it whole.", type=int, default=0)
+    arg_parser.add_argument("--render_scratch", help="Memory mapped scratch file to render bands into when --band_rows is set.", type=str, default=None)
 
-    return arg_parser.parse_known_args()
+    return arg_parser.parse_known_args(argv)
+
+def save_maze_images(maze: WordMaze, outputs: Dict[str, float], archive: "MazeArchive" = None, **info):
+    """Save the maze's current render to files, or into the batch archive if there is one"""
+    if archive:
+        archive.add_images(maze, outputs, **info)
+    else:
+        maze.save_images(outputs)
 
 if __name__ == "__main__":
     args, _ = parseargs()
 
-    for i in range(args.num_to_generate):
-        maze = WordMaze(args.word, args.grid_width, args.grid_height, args.pixel_width, args.pixel_height, args=args)
-        maze.save_image(args.filename.split(".")[0] + "_" + str(i) + ".png")
-
-        if args.direction_display:
-            maze.map.draw_block_directions()
-            maze.map.draw()
-            maze.save_image(args.filename.split(".")[0] + "_" + str(i) + "_path_directions.png")
+    # Only pulled in when asked for, flask_app imports this module for parseargs
+    if args.validate:
+        from utils.validator import validate_maze
+    if args.archive:
+        from utils.archive import MazeArchive
 
-        if args.num_exit_display:
-            maze.map.draw_block_exit_count()
-            maze.map.draw()
-            maze.save_image(args.filename.split(".")[0] + "_" + str(i) + "_num_exit_display.png")
+    # The archive is closed (and its manifest written) even if a maze fails partway through the batch
+    with MazeArchive(args.archive) if args.archive else nullcontext() as archive:
+        for i in range(args.num_to_generate):
+            maze = WordMaze(args.word, args.grid_width, args.grid_height, args.pixel_width, args.pixel_height, args=args)
+            if args.validate:
+                for failure in validate_maze(maze):
+                    print(f"Maze {i} failed {failure.check}: {failure.message} {failure.cells}")
+            # Every variant below reuses this maze, draw() only repaints the blocks that changed
+            base_name = args.filename.split(".")[0] + "_" + str(i)
+            outputs = {base_name + ".png": 1}
+            if args.preview_scale:
+                outputs[base_name + "_preview.png"] = args.preview_scale
+            save_maze_images(maze, outputs, archive, index=i, variant="maze")
 
-        if args.solution:
-            maze.solve_maze(True)
-            maze.map.draw()
-            maze.save_image(args.filename.split(".")[0] + "_" + str(i) + "_solution.png")
+            if args.direction_display:
+                maze.map.draw_block_directions()
+                maze.map.draw()
+                save_maze_images(maze, {base_name + "_path_directions.png": 1}, archive, index=i, variant="path_directions")
 
+            if args.num_exit_display:
+                maze.map.draw_block_exit_count()
+                maze.map.draw()
+                save_maze_images(maze, {base_name + "_num_exit_display.png": 1}, archive, index=i, variant="num_exit_display")
 
-    
+            if args.solution:
+                maze.solve_maze(True)
+                maze.map.draw()
+                save_maze_images(maze, {base_name + "_solution.png": 1}, archive, index=i, variant="solution")
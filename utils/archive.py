@@ -0,0 +1,103 @@
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import zipfile
+from typing import BinaryIO, Dict
+
+from utils.map import Maze
+
+MANIFEST_NAME = "manifest.json"
+# Images bigger than this wait on disk rather than in memory before being copied into the archive
+SPOOL_MAX_BYTES = 16 * 1024 * 1024
+
+class MazeArchive:
+    """Write a batch of maze images into a single zip or tar file along with a JSON manifest.
+
+    The archive type follows the filename: .zip, .tar, .tar.gz or .tgz.
+    """
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.manifest = []
+        self.closed = False
+
+        if filename.endswith(".zip"):
+            # PNGs are already compressed, deflating them again only costs time
+            self._zip = zipfile.ZipFile(filename, "w", zipfile.ZIP_STORED)
+            self._tar = None
+        elif filename.endswith((".tar", ".tar.gz", ".tgz")):
+            self._zip = None
+            self._tar = tarfile.open(filename, "w" if filename.endswith(".tar") else "w:gz")
+        else:
+            raise ValueError("Archive filename must end in .zip, .tar, .tar.gz or .tgz.")
+
+    def __enter__(self) -> "MazeArchive":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write_member(self, name: str, file: BinaryIO):
+        """Copy everything in file, from the start, into the archive as name"""
+        if self._zip:
+            file.seek(0)
+            with self._zip.open(name, "w", force_zip64=True) as member:
+                shutil.copyfileobj(file, member)
+            return
+
+        info = tarfile.TarInfo(name)
+        info.size = file.seek(0, io.SEEK_END)
+        info.mtime = int(time.time())
+        file.seek(0)
+        self._tar.addfile(info, file)
+
+    def add_images(self, maze: Maze, outputs: Dict[str, float], **info):
+        """Render the maze once into a member per name, resampled by the scale it maps to.
+
+        Any extra keyword arguments (e.g. index or variant) are recorded in the manifest.
+        """
+        # Members sit at the top of the archive whatever directory the names point into
+        member_names = {name: os.path.basename(name) for name in outputs}
+
+        if self._zip and len(outputs) == 1:
+            # A lone zip member is written as the image is encoded. If the save fails the
+            # truncated member is left behind, but it never makes it into the manifest
+            name, scale = next(iter(outputs.items()))
+            with self._zip.open(member_names[name], "w", force_zip64=True) as member:
+                maze.save_images({member: scale})
+        else:
+            # One render feeds every output at once, but a zip only takes one open member at a
+            # time and a tar needs each member's size up front, so spool them until they're done
+            spools = {name: tempfile.SpooledTemporaryFile(SPOOL_MAX_BYTES) for name in outputs}
+            try:
+                maze.save_images({spools[name]: scale for name, scale in outputs.items()})
+                for name, spool in spools.items():
+                    self._write_member(member_names[name], spool)
+            finally:
+                for spool in spools.values():
+                    spool.close()
+
+        for name, scale in outputs.items():
+            self.manifest.append({
+                "file": member_names[name],
+                "scale": scale,
+                "word": getattr(maze, "word", None),
+                "grid_width": maze.map.grid_width,
+                "grid_height": maze.map.grid_height,
+                **info,
+            })
+
+    def close(self):
+        if self.closed:
+            return
+
+        self.closed = True
+        self._write_member(MANIFEST_NAME, io.BytesIO(json.dumps(self.manifest, indent=2).encode()))
+
+        if self._zip:
+            self._zip.close()
+        else:
+            self._tar.close()
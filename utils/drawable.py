@@ -1,11 +1,32 @@
 from abc import ABC, abstractmethod
+from functools import lru_cache
 import random
-from typing import List
+import struct
+import zlib
+from typing import BinaryIO, Dict, List
 import numpy as np
 from PIL import Image
 
 from utils.utils import GridDirection
 
+# Rows of the top and bottom edge repeated around a saved image
+PNG_PADDING_ROWS = 30
+FONT_PATH = "data/Arial.ttf"
+
+@lru_cache(maxsize=None)
+def load_font(size: int):
+    """Load the letter font at a pixel size, each size is only read from disk once"""
+    from PIL import ImageFont
+
+    return ImageFont.truetype(FONT_PATH, size=size, encoding="unic")
+
+def warm_up(font_sizes: List[int]):
+    """Preload the drawing modules and fonts ahead of the first maze, e.g. before forking web workers"""
+    from PIL import ImageDraw
+
+    for size in font_sizes:
+        load_font(size)
+
 class InvalidColorValue(Exception):
     pass
 
@@ -37,16 +58,115 @@ class ColorPallete:
         setattr(self, key, color)
 
 
+# How far a scale's factor may be from a whole number, so 0.333 still resamples by 3
+SCALE_FACTOR_TOLERANCE = 0.05
+
+def get_scale_factor(scale: float) -> int:
+    """Turn a scale like 2, 0.25 or 0.333 into the nearest integer factor used to resample by it"""
+    if scale <= 0:
+        raise ValueError(f"Scale {scale} must be greater than 0.")
+
+    factor = scale if scale >= 1 else 1 / scale
+    if abs(factor - round(factor)) > SCALE_FACTOR_TOLERANCE:
+        raise ValueError(f"Scale {scale} must be a whole number or one over a whole number.")
+
+    return int(round(factor))
+
+def scale_canvas(canvas: np.ndarray, scale: float) -> np.ndarray:
+    """Resample an (height, width, 3) canvas by an integer factor.
+
+    Scales above 1 repeat pixels, scales below 1 average square blocks of pixels,
+    trimming any rows or columns that don't fill a whole block.
+    """
+    factor = get_scale_factor(scale)
+    if factor == 1:
+        return canvas
+
+    if scale > 1:
+        return np.repeat(np.repeat(canvas, factor, axis=0), factor, axis=1)
+
+    height, width = canvas.shape[0] // factor, canvas.shape[1] // factor
+    blocks = canvas[:height * factor, :width * factor].reshape((height, factor, width, factor, 3))
+    return blocks.mean(axis=(1, 3), dtype=np.float32).round().astype(np.uint8)
+
+def get_scaled_size(width: int, height: int, scale: float) -> tuple:
+    """Size of a width x height canvas after scale_canvas"""
+    factor = get_scale_factor(scale)
+    if scale >= 1:
+        return (width * factor, height * factor)
+
+    return (width // factor, height // factor)
+
+def get_padding_rows(scale: float) -> int:
+    """Rows of padding above and below an image saved at scale"""
+    return get_scaled_size(0, PNG_PADDING_ROWS, scale)[1]
+
+class PNGStreamWriter:
+    """Encode an RGB image into a PNG file a few rows at a time.
+
+    Rows are filtered and compressed as they arrive so only the rows handed to
+    write_rows need to be held in memory, never the whole image.
+    """
+    SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+    def __init__(self, file: BinaryIO, width: int, height: int, compression_level: int = 6):
+        self.file = file
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(compression_level)
+
+        self.file.write(self.SIGNATURE)
+        # 8 bit depth, truecolor, deflate, adaptive filtering, no interlace
+        self._write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def __enter__(self) -> "PNGStreamWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # After an error the PNG is left unfinished, removing the partial file is up to the caller
+        if exc_type is None:
+            self.close()
+
+    def _write_chunk(self, chunk_type: bytes, data: bytes):
+        self.file.write(struct.pack(">I", len(data)))
+        self.file.write(chunk_type)
+        self.file.write(data)
+        self.file.write(struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF))
+
+    def write_rows(self, rows: np.ndarray):
+        rows = np.asarray(rows, dtype=np.uint8).reshape((-1, self.width * 3))
+        if self.rows_written + len(rows) > self.height:
+            raise ValueError("More rows written than the PNG header allows.")
+
+        # Use the "Sub" filter, flat colored runs compress down to almost nothing
+        filtered = np.empty((len(rows), self.width * 3 + 1), dtype=np.uint8)
+        filtered[:, 0] = 1
+        filtered[:, 1:4] = rows[:, :3]
+        np.subtract(rows[:, 3:], rows[:, :-3], out=filtered[:, 4:])
+
+        compressed = self._compressor.compress(filtered.tobytes())
+        if compressed:
+            self._write_chunk(b"IDAT", compressed)
+        self.rows_written += len(rows)
+
+    def close(self):
+        if self.rows_written != self.height:
+            raise ValueError(f"PNG expected {self.height} rows but only {self.rows_written} were written.")
+
+        self._write_chunk(b"IDAT", self._compressor.flush())
+        self._write_chunk(b"IEND", b"")
+
+
 class Drawable2D(ABC):
-    def __init__(self, width: int, height: int, default_color: Color = Color(255, 255, 255)):
-        self.color_array = [[Color(*default_color) for _ in range(width)] for _ in range(height)]
+    def __init__(self, width: int, height: int, default_color: Color = Color(255, 255, 255), allocate: bool = True):
+        self.color_array = [[Color(*default_color) for _ in range(width)] for _ in range(height)] if allocate else None
         self.width = width
         self.height = height
         self.pallete = ColorPallete(default_color)
 
     def fill(self, color: Color):
-        width, height, _ = np.shape(self.color_array)
-        self.color_array = [[Color(*color) for _ in range(width)] for _ in range(height)]
+        self.color_array = [[Color(*color) for _ in range(self.width)] for _ in range(self.height)]
     
     def valid_pixel(self, x: int, y: int):
         ret_val = True
@@ -87,15 +207,20 @@ class Drawable2D(ABC):
             current_x += delta_x
 
     def save_array_as_png(self, filename: str):
-        header_lines = [self.color_array[0].copy() for _ in range(30)]
-        footer_lines = [self.color_array[-1].copy() for _ in range(30)]
+        self.save_array_as_pngs({filename: 1})
+
+    def save_array_as_pngs(self, outputs: Dict[str or BinaryIO, float]):
+        """Save the current canvas once per filename (or open binary file), resampled by the scale it maps to"""
+        color_array = np.array(self.color_array).astype(np.uint8)
 
-        header_lines.extend(self.color_array)
-        header_lines = header_lines + footer_lines
+        for filename, scale in outputs.items():
+            scaled = scale_canvas(color_array, scale)
+            padding_rows = get_padding_rows(scale)
+            header_lines = np.repeat(scaled[:1], padding_rows, axis=0)
+            footer_lines = np.repeat(scaled[-1:], padding_rows, axis=0)
 
-        color_array = np.array(header_lines)
-        im = Image.fromarray(color_array.astype(np.uint8))
-        im.save(filename) 
+            im = Image.fromarray(np.concatenate([header_lines, scaled, footer_lines]))
+            im.save(filename, format="PNG")
 
 
     def draw_portion(self, start_x: int, start_y: int, input_array: List[List[Color]]):
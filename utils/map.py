@@ -2,52 +2,67 @@ import argparse
 import os
 import glob
 import string
-from utils.drawable import COLOR_BLACK, COLOR_GRAY, COLOR_GREEN, COLOR_RED, COLOR_WHITE, Drawable2D, Color
-from typing import List, Tuple, Set
+from utils.drawable import COLOR_BLACK, COLOR_GRAY, COLOR_GREEN, COLOR_RED, COLOR_WHITE, Drawable2D, Color, PNGStreamWriter, get_padding_rows, get_scale_factor, get_scaled_size, load_font, scale_canvas
+from typing import BinaryIO, Dict, Iterator, List, Tuple, Set
 import numpy as np
 import random
-from PIL import Image, ImageDraw, ImageFont
-import imageio
-from natsort import natsorted
+from PIL import Image
 
-from utils.utils import GridDirection
+from utils.utils import DIRECTION_BITS, GridDirection
 
-class ObservableList(set):
-    def __init__(self, list_in: List = None):
-        if not list_in:
-            list_in = []
-        self._has_changed = False
-        super().__init__(list_in)
-    
-    def remove(self, __value) -> None:
-        self._has_changed = True
-        return super().remove(__value)
+HEX_DIGITS = np.array(list("0123456789abcdef"))
 
-    def add(self, __object) -> None:
-        self._has_changed = True
-        return super().add(__object)
-    
-    
+def get_debug_frames(pattern: str) -> List[str]:
+    """Naturally sorted debug frames matching pattern, natsort is only needed for the GIF flags"""
+    from natsort import natsorted
 
+    return natsorted(glob.glob(pattern))
 
-class Block(Drawable2D):
-    def __init__(self, width: int, height: int, entry_direction: GridDirection = None, exit_directions: List[GridDirection] = None):
-        super().__init__(width, height)
+def save_debug_gif(files: List[str], filename: str, fps: int):
+    """Stitch debug frames into a GIF, imageio is only needed for the GIF flags"""
+    import imageio
 
-        self.pallete.add("wall_color", COLOR_BLACK)
-        self.pallete.add("background_color", COLOR_WHITE)
+    frames = [imageio.imread(image) for image in files]
+    imageio.mimsave(filename, frames, fps=fps)
 
-        self.exit_directions = exit_directions if exit_directions else []
-        self.entry_direction = entry_direction
+# Walls of every block, whether drawn by a BlockSprite or straight into a band
+WALL_COLOR = COLOR_BLACK
+
+def draw_letter(pixels: np.ndarray, letter: str) -> np.ndarray:
+    """Draw letter centred on a (height, width, 3) block of pixels, returning the new pixels"""
+    from PIL import ImageDraw
+
+    width = pixels.shape[1]
+    pil_font = load_font(width)
+    text_width, text_height = pil_font.getsize(letter)
+
+    canvas = Image.fromarray(pixels)
+    draw = ImageDraw.Draw(canvas)
+    offset = ((width - text_width) // 2, (width - text_height) // 2)
+    black = "#000000"
+    draw.text(offset, letter, font=pil_font, fill=black)
+
+    return np.asarray(canvas)
+
+class Block:
+    """A single cell of the maze, its pixels live in a BlockSprite created only when drawn"""
+    __slots__ = ("width", "height", "explored", "entry_direction", "background_color", "sprite", "_letter", "_exit_directions", "_has_changed")
+
+    def __init__(self, width: int, height: int, entry_direction: GridDirection = None, exit_directions: List[GridDirection] = None):
+        self.width = width
+        self.height = height
         self.explored = False
-        self.letter = None
+        self.entry_direction = entry_direction
+        self.background_color = COLOR_WHITE
+        self.sprite = None
+
+        self._exit_directions = set(exit_directions) if exit_directions else set()
+        self._letter = None
+        # Forces the next draw even if nothing visible changed
         self._has_changed = True
 
     @property
     def letter(self):
-        if not hasattr(self, "_letter"):
-            self._letter = None
-        
         return self._letter
     
     @letter.setter
@@ -56,73 +71,69 @@ class Block(Drawable2D):
             return
         
         self._letter = new_letter
-        self._has_changed = True
 
     @property
-    def entry_direction(self):
-        if not hasattr(self, "_entry_direction"):
-            self._entry_direction = None
-
-        return self._entry_direction
-    
-    @entry_direction.setter
-    def entry_direction(self, direction: GridDirection):
-        self._has_changed = True
-        self._entry_direction = direction
-    
-    @property
-    def exit_directions(self):
-        if not hasattr(self, "_exit_directions"):
-            self._exit_directions = ObservableList()
-        
+    def exit_directions(self) -> Set[GridDirection]:
         return self._exit_directions
     
     @exit_directions.setter
     def exit_directions(self, directions: List[GridDirection]):
-        if not directions:
-            return 
+        self._exit_directions = set(directions)
 
-        self._exit_directions = ObservableList(directions)
+    @property
+    def exit_bits(self) -> int:
+        """Exit directions packed with DIRECTION_BITS"""
+        return sum(DIRECTION_BITS[direction] for direction in self._exit_directions)
     
     @property
     def is_multi_exit(self):
-        return bool(len(self.exit_directions) > 1)
+        return len(self._exit_directions) > 1
 
     def draw(self) -> List[List[Color]]:
-        """Draw our block in 2D"""
-        if not self._has_changed and not self.exit_directions._has_changed:
+        """Draw our block in 2D, returns None when the pixels already match the block"""
+        state = (self.explored, self.entry_direction, frozenset(self._exit_directions), self._letter, self.background_color)
+        if not self._has_changed and self.sprite is not None and self.sprite.drawn_state == state:
             return None
 
-        if not self.explored:
+        if self.sprite is None:
+            self.sprite = BlockSprite(self.width, self.height)
+
+        self._has_changed = False
+        return self.sprite.draw_block(self, state)
+
+class BlockSprite(Drawable2D):
+    """The pixels for a Block, kept apart so undrawn blocks carry no pixel buffer"""
+    def __init__(self, width: int, height: int):
+        super().__init__(width, height, allocate=False)
+
+        self.pallete.add("wall_color", WALL_COLOR)
+        self.drawn_state = None
+
+    def draw_block(self, block: Block, state: tuple) -> List[List[Color]]:
+        self.drawn_state = state
+        if not block.explored:
             self.fill(COLOR_BLACK)
         else:
-            self.fill(self.pallete.background_color)
+            self.fill(block.background_color)
 
         for direction in GridDirection:
-            if direction not in self.exit_directions and direction != self.entry_direction:
+            if direction not in block.exit_directions and direction != block.entry_direction:
                 self.draw_edge(direction, self.pallete.wall_color)
         
-        if self.letter:
-            font = 'data/Arial.ttf'
-            pil_font = ImageFont.truetype(f"{font}", size=self.width, encoding="unic")
-            text_width, text_height = pil_font.getsize(self.letter)
-
-            canvas = Image.fromarray(np.array(self.color_array).astype(np.uint8))
-            draw = ImageDraw.Draw(canvas)
-            offset = ((self.width - text_width) // 2, (self.width - text_height) // 2)
-            black = "#000000"
-            draw.text(offset, self.letter, font=pil_font, fill=black)
-            self.color_array = np.asarray(canvas)
-            self.color_array.reshape((self.height, self.width, 3))
-            self.color_array = self.color_array.tolist()
+        if block.letter:
+            self.color_array = draw_letter(np.array(self.color_array).astype(np.uint8), block.letter).tolist()
 
-        self._has_changed = False
+        return self.color_array
+
+    def draw(self) -> List[List[Color]]:
         return self.color_array
 
 class Map(Drawable2D):
-    def __init__(self, grid_width: int, grid_height: int, block_width: int = 10, block_height: int = 10, path_prefix:str = None, args: argparse.Namespace = None):
-        super().__init__(grid_width * block_width, grid_height * block_height)
+    def __init__(self, grid_width: int, grid_height: int, block_width: int = 10, block_height: int = 10, path_prefix:str = None, args: argparse.Namespace = None, render: bool = True):
         self.args = args
+        self.render = render
+        # Banded and unrendered maps never hold the full framebuffer, it is rendered at save time
+        super().__init__(grid_width * block_width, grid_height * block_height, allocate=not self.renders_on_save)
         self.path_prefix = path_prefix
 
         self.grid_width = grid_width
@@ -133,12 +144,71 @@ class Map(Drawable2D):
 
         self.block_grid = [[Block(self.block_width, self.block_height) for _ in range(self.grid_width)] for _ in range(self.grid_height)]
 
+    @property
+    def band_rows(self) -> int:
+        """Number of block rows rendered at a time, 0 when the whole map is kept in memory"""
+        if self.args and hasattr(self.args, "band_rows") and self.args.band_rows:
+            return self.args.band_rows
+
+        return 0
+
+    @property
+    def renders_on_save(self) -> bool:
+        """True when draw() does nothing and pixels are only rendered when saving"""
+        return bool(self.band_rows) or not self.render
+
     def save_debug_image(self, filename_prefix:str):
-        self.clean_all_blocks()
+        if self.renders_on_save:
+            self.save_banded_png(f"{filename_prefix}.png")
+            return
+
         self.draw()
         self.save_array_as_png(f"{filename_prefix}.png")
 
+    def connect(self, block: Block, direction: GridDirection) -> Block or None:
+        """Exit block in direction and enter the neighbour there from it, updating both sides at once.
+
+        A block is only ever entered from one side, so whichever block the neighbour used to be
+        entered from loses its exit. Exits off the edge of the grid have no neighbour and return None.
+        """
+        if direction == block.entry_direction:
+            raise ValueError("A block can't exit through its own entry.")
+
+        block.exit_directions.add(direction)
+        to_block = self.get_block_in_direction(block, direction, False)
+        if not to_block:
+            return None
+
+        entry_direction = GridDirection.get_opposite_direction(direction)
+        if to_block.entry_direction and to_block.entry_direction != entry_direction:
+            self.disconnect_entry(to_block)
+        to_block.entry_direction = entry_direction
+
+        return to_block
+
+    def disconnect(self, block: Block, direction: GridDirection) -> Block or None:
+        """Close block's exit in direction, leaving the neighbour there without an entry"""
+        block.exit_directions.discard(direction)
+        to_block = self.get_block_in_direction(block, direction, False)
+
+        if to_block and to_block.entry_direction == GridDirection.get_opposite_direction(direction):
+            to_block.entry_direction = None
+
+        return to_block
+
+    def disconnect_entry(self, block: Block):
+        """Close block's entry along with the exit leading into it"""
+        if not block.entry_direction:
+            return
+
+        from_block = self.get_block_in_direction(block, block.entry_direction, False)
+        if from_block:
+            from_block.exit_directions.discard(GridDirection.get_opposite_direction(block.entry_direction))
+
+        block.entry_direction = None
+
     def clean_all_blocks(self):
+        """Repair every block's relationships, only needed after editing exits and entries directly"""
         for y in range(len(self.block_grid)):
             for x in range(len(self.block_grid[y])):
                 self.clean_block_relationships(self.block_grid[y][x])
@@ -255,6 +325,28 @@ class Map(Drawable2D):
         
         return self.block_grid[check_y][check_x]
 
+    def get_grid_state(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Snapshot the grid as (exit_bits, entry_bits, explored, letters) arrays indexed [y, x].
+
+        Directions are packed with DIRECTION_BITS, letters are "" for blocks without one.
+        """
+        exit_bits = np.zeros((self.grid_height, self.grid_width), dtype=np.uint8)
+        entry_bits = np.zeros((self.grid_height, self.grid_width), dtype=np.uint8)
+        explored = np.zeros((self.grid_height, self.grid_width), dtype=bool)
+        letters = np.full((self.grid_height, self.grid_width), "", dtype="<U1")
+
+        for y in range(self.grid_height):
+            for x in range(self.grid_width):
+                block = self.block_grid[y][x]
+                exit_bits[y, x] = block.exit_bits
+                if block.entry_direction:
+                    entry_bits[y, x] = DIRECTION_BITS[block.entry_direction]
+                explored[y, x] = block.explored
+                if block.letter:
+                    letters[y, x] = block.letter
+
+        return exit_bits, entry_bits, explored, letters
+
     def draw_block_exit_count(self):
         for y in range(len(self.block_grid)):
             for x in range(len(self.block_grid[y])):
@@ -277,15 +369,134 @@ class Map(Drawable2D):
                     curr_block.letter = ">"
     
     def draw(self) -> List[List[Color]]:
+        # Banded and unrendered maps rasterize when saved
+        if self.renders_on_save:
+            return self.color_array
+
         for y in range(len(self.block_grid)):
             for x in range(len(self.block_grid[y])):
-                self.clean_block_relationships(self.block_grid[y][x])
                 block_color_data = self.block_grid[y][x].draw()
                 if block_color_data:
                     self.draw_portion(x * self.block_width, y * self.block_height, block_color_data)
         
         return self.color_array
 
+    def draw_band(self, start_row: int, end_row: int) -> np.ndarray:
+        """Render the block rows [start_row, end_row) into their own pixel array.
+
+        Blocks are painted with whole array fills and wall slices instead of per pixel
+        through BlockSprite, the pixels come out the same.
+        """
+        rows = self.block_grid[start_row:end_row]
+        colors = np.empty((len(rows), self.grid_width, 3), dtype=np.uint8)
+        openings = np.zeros((len(rows), self.grid_width), dtype=np.uint8)
+        letters = []
+
+        for y, row in enumerate(rows):
+            for x, block in enumerate(row):
+                colors[y, x] = block.background_color if block.explored else COLOR_BLACK
+                openings[y, x] = block.exit_bits
+                if block.entry_direction:
+                    openings[y, x] |= DIRECTION_BITS[block.entry_direction]
+                if block.letter:
+                    letters.append((y, x, block.letter))
+
+        band = np.repeat(np.repeat(colors, self.block_height, axis=0), self.block_width, axis=1)
+        # The same pixels indexed [block row, pixel y, block column, pixel x]
+        blocks = band.reshape((len(rows), self.block_height, self.grid_width, self.block_width, 3))
+
+        walls = {direction: (openings & DIRECTION_BITS[direction]) == 0 for direction in GridDirection}
+        blocks[:, 0][walls[GridDirection.North]] = WALL_COLOR
+        blocks[:, -1][walls[GridDirection.South]] = WALL_COLOR
+        blocks[:, :, :, 0].transpose((0, 2, 1, 3))[walls[GridDirection.West]] = WALL_COLOR
+        blocks[:, :, :, -1].transpose((0, 2, 1, 3))[walls[GridDirection.East]] = WALL_COLOR
+
+        for y, x, letter in letters:
+            blocks[y, :, x] = draw_letter(np.ascontiguousarray(blocks[y, :, x]), letter)
+
+        return band
+
+    def iter_bands(self) -> Iterator[np.ndarray]:
+        """Yield the rendered map top to bottom, one band of band_rows block rows at a time"""
+        band_rows = self.band_rows if self.band_rows else self.grid_height
+
+        for start in range(0, self.grid_height, band_rows):
+            yield self.draw_band(start, min(start + band_rows, self.grid_height))
+
+    def save_banded_png(self, filename: str, scratch_path: str = None):
+        self.save_banded_pngs({filename: 1}, scratch_path)
+
+    def save_banded_pngs(self, outputs: Dict[str or BinaryIO, float], scratch_path: str = None):
+        """Render and encode the map band by band, never holding the whole image in memory.
+
+        Every band is rendered once and handed to one encoder per filename (or open binary file), resampled
+        by the scale that filename maps to. If a scratch_path is given the bands are
+        rendered into a memory mapped file first and streamed to the encoders from there.
+        """
+        if scratch_path is None and self.args and hasattr(self.args, "render_scratch"):
+            scratch_path = self.args.render_scratch
+
+        band_height = (self.band_rows if self.band_rows else self.grid_height) * self.block_height
+        canvas = None
+        png_files = []
+        writers = []
+        saved = False
+        try:
+            bands = self.iter_bands()
+            if scratch_path:
+                canvas = np.memmap(scratch_path, dtype=np.uint8, mode="w+", shape=(self.height, self.width, 3))
+                pixel_y = 0
+                for band in bands:
+                    canvas[pixel_y:pixel_y + len(band)] = band
+                    pixel_y += len(band)
+                canvas.flush()
+                bands = (canvas[y:y + band_height] for y in range(0, self.height, band_height))
+
+            for filename, scale in outputs.items():
+                width, height = get_scaled_size(self.width, self.height, scale)
+                if isinstance(filename, str):
+                    png_files.append(open(filename, "wb"))
+                    png_file = png_files[-1]
+                else:
+                    png_file = filename
+                writers.append(PNGStreamWriter(png_file, width, height + 2 * get_padding_rows(scale)))
+
+            scales = list(outputs.values())
+            # Downsampling averages whole pixel blocks, rows that don't fill one yet wait for the
+            # next band and any still left at the bottom are trimmed, the same as scale_canvas
+            carried_rows = [np.empty((0, self.width, 3), dtype=np.uint8) for _ in scales]
+            last_rows = [None] * len(scales)
+            for band in bands:
+                for index, (writer, scale) in enumerate(zip(writers, scales)):
+                    rows = band
+                    if scale < 1:
+                        rows = np.concatenate([carried_rows[index], band])
+                        usable_rows = len(rows) - len(rows) % get_scale_factor(scale)
+                        rows, carried_rows[index] = rows[:usable_rows], rows[usable_rows:]
+                        if not usable_rows:
+                            continue
+
+                    scaled = scale_canvas(rows, scale)
+                    if last_rows[index] is None:
+                        writer.write_rows(np.repeat(scaled[:1], get_padding_rows(scale), axis=0))
+                    writer.write_rows(scaled)
+                    last_rows[index] = scaled[-1:]
+
+            for writer, scale, last_row in zip(writers, scales, last_rows):
+                writer.write_rows(np.repeat(last_row, get_padding_rows(scale), axis=0))
+                writer.close()
+            saved = True
+        finally:
+            for png_file in png_files:
+                png_file.close()
+                # Don't leave truncated PNGs behind when a band fails to render or encode
+                if not saved:
+                    os.remove(png_file.name)
+
+            if canvas is not None:
+                del canvas
+                os.remove(scratch_path)
+
 class Path:
     def __init__(self, map: Map, start_block: Block or List[Block], min_path_length: int = 1):
         self.map = map
@@ -303,8 +514,7 @@ class Path:
 
         for direction, check_block in self.map.get_blocks_in_all_directions(block):
             if check_block and random.randint(1, 100) < int(chance * 100):
-                block.exit_directions.add(direction)
-                check_block.entry_direction = GridDirection.get_opposite_direction(direction)
+                self.map.connect(block, direction)
                 ret_val.append(check_block)
         
         return ret_val
@@ -341,17 +551,16 @@ class Path:
         return ret_blocks
 
 class Maze:
-    def __init__(self, grid_width: int, grid_height: int, block_width: int, block_height: int, args:argparse.Namespace = None) -> Tuple[int, Block]:
-        self.map = Map(grid_width, grid_height, block_width, block_height, "MazePathImage", args)
+    def __init__(self, grid_width: int, grid_height: int, block_width: int, block_height: int, args:argparse.Namespace = None, render: bool = True) -> Tuple[int, Block]:
+        self.map = Map(grid_width, grid_height, block_width, block_height, "MazePathImage", args, render)
         self.args = args
         self.generate_maze()
         self.solve_maze()
 
         if self.args and hasattr(self.args, "show_path_generation") and self.args.show_path_generation:
-            files = natsorted(glob.glob(f"{self.map.path_prefix}_*.png"))
+            files = get_debug_frames(f"{self.map.path_prefix}_*.png")
             if files:
-                frames = [imageio.imread(image) for image in files]
-                imageio.mimsave("path_building_maze.gif", frames, fps=2)
+                save_debug_gif(files, "path_building_maze.gif", fps=2)
 
     def get_lowest_block(self):
         for y in range(self.map.grid_height - 1, -1, -1):
@@ -401,15 +610,14 @@ class Maze:
             
             # Get the lowest block and set an exit direction (South)
             y, lowest_block = self.get_lowest_block()
-            lowest_block.exit_directions.add(GridDirection.South)
+            south_block = self.map.connect(lowest_block, GridDirection.South)
 
             # If we have hit the bottom of the play area make this our end block
             if y == self.map.grid_height - 1:
                 self.map_end = lowest_block
             # If we haven't hit the bottom then make this our next start block for random paths
             else:
-                new_start = self.map.get_block_in_direction(lowest_block, GridDirection.South)
-                new_start.entry_direction = GridDirection.North
+                new_start = south_block
 
         # Draw the final maze
         self.map.draw()
@@ -444,20 +652,54 @@ class Maze:
         
         if paint_path:
             for block in self.solution_path.blocks:
-                block.pallete.background_color = COLOR_GREEN
-                block._has_changed = True
-        
-        self.map.clean_all_blocks()
+                block.background_color = COLOR_GREEN
+
+    def to_structure(self, include_solution: bool = False) -> dict:
+        """Describe the maze for drawing elsewhere (e.g. a browser canvas) as JSON friendly data.
+
+        walls holds one hex digit per block with DIRECTION_BITS set for every closed side,
+        "f" meaning a solid unexplored block. letters holds a space for blocks without one.
+        """
+        exit_bits, entry_bits, _, letters = self.map.get_grid_state()
+        walls = HEX_DIGITS[0xF & ~(exit_bits | entry_bits)]
+        letters[letters == ""] = " "
+
+        structure = {
+            "width": self.map.grid_width,
+            "height": self.map.grid_height,
+            "walls": ["".join(row) for row in walls],
+            "letters": ["".join(row) for row in letters],
+            "start": list(self.map.get_block_x_y_tuple(self.map_start)),
+            "end": list(self.map.get_block_x_y_tuple(self.map_end)),
+        }
+
+        if include_solution and self.solution_path:
+            structure["solution"] = [list(self.map.get_block_x_y_tuple(block)) for block in self.solution_path.blocks]
+
+        return structure
 
     def save_image(self, filename: str):
-        return self.map.save_array_as_png(filename)
+        return self.save_images({filename: 1})
+
+    def save_images(self, outputs: Dict[str or BinaryIO, float]):
+        """Save one render of the maze at several sizes, e.g. {"maze.png": 1, "preview.png": 0.25}"""
+        # Checked here so whole and banded rendering accept exactly the same scales
+        for scale in outputs.values():
+            width, height = get_scaled_size(self.map.width, self.map.height, scale)
+            if not width or not height:
+                raise ValueError(f"Scale {scale} shrinks the {self.map.width}x{self.map.height} pixel maze to nothing.")
+
+        if self.map.renders_on_save:
+            return self.map.save_banded_pngs(outputs)
+
+        return self.map.save_array_as_pngs(outputs)
          
       
 class WordMaze(Maze):
-    def __init__(self, word: str, grid_width: int = 20, grid_height: int = 20, block_width: int = 20, block_height: int = 20, args:argparse.Namespace = None):
+    def __init__(self, word: str, grid_width: int = 20, grid_height: int = 20, block_width: int = 20, block_height: int = 20, args:argparse.Namespace = None, render: bool = True):
         if not word.isalpha():
             raise ValueError("Word contains invalid characters, only alphabet characters are allowed.")
-        super().__init__(grid_width, grid_height, block_width, block_height, args=args)
+        super().__init__(grid_width, grid_height, block_width, block_height, args=args, render=render)
         parent_prefix = self.map.path_prefix
         self.map.path_prefix = "WordMazePathImage"
         self.word = word
@@ -465,19 +707,17 @@ class WordMaze(Maze):
         self.map.draw()
 
         if self.args and hasattr(self.args, "show_path_generation") and self.args.show_path_generation:
-            parent_files = [natsorted(glob.glob(f"{parent_prefix}_*.png"))[-1] * 10]
-            files = parent_files.append(natsorted(glob.glob(f"{self.map.path_prefix}_*.png")))
+            parent_files = [get_debug_frames(f"{parent_prefix}_*.png")[-1] * 10]
+            files = parent_files.append(get_debug_frames(f"{self.map.path_prefix}_*.png"))
 
             if files:
-                frames = [imageio.imread(image) for image in files]
-                imageio.mimsave("path_building_word_maze.gif", frames, fps=2)
+                save_debug_gif(files, "path_building_word_maze.gif", fps=2)
 
         if self.args and hasattr(self.args, "show_letter_placement") and self.args.show_letter_placement:
-            files = natsorted(glob.glob(f"LetterPlacementImage_*.png"))
+            files = get_debug_frames(f"LetterPlacementImage_*.png")
 
             if files:
-                frames = [imageio.imread(image) for image in files]
-                imageio.mimsave("letter_placement.gif", frames, fps=6)
+                save_debug_gif(files, "letter_placement.gif", fps=6)
 
                 for file in files:
                     try:
@@ -491,22 +731,19 @@ class WordMaze(Maze):
             return
 
         # Close off the entry
-        exit_block = self.map.get_block_in_direction(block, block.entry_direction, False)
-        exit_block.exit_directions.remove(GridDirection.get_opposite_direction(block.entry_direction))
+        self.map.disconnect_entry(block)
 
         blocks_to_clear = set([block])
 
         while blocks_to_clear:
             curr_block = list(blocks_to_clear)[0]
-            curr_block.entry_direction = None
             curr_block.explored = False
             blocks_to_clear.remove(curr_block)
 
-            for direction in curr_block.exit_directions:
-                next_block = self.map.get_block_in_direction(curr_block, direction, False)
-                blocks_to_clear.add(next_block)
-            
-            curr_block.exit_directions = set()
+            for direction in list(curr_block.exit_directions):
+                next_block = self.map.disconnect(curr_block, direction)
+                if next_block:
+                    blocks_to_clear.add(next_block)
 
     def place_letter_in_exit_blocks(self, block_with_exits: Block, word_index: int = None) -> None:
         invalid_letters = [l for l in string.ascii_letters if l not in self.word]
@@ -519,7 +756,7 @@ class WordMaze(Maze):
             letter_block = self.map.get_block_in_direction(block_with_exits, direction, False)
 
             if not letter_block:
-                block_with_exits.exit_directions.remove(direction)
+                self.map.disconnect(block_with_exits, direction)
                 continue
 
             if letter_block in self.solution_path.blocks and word_index is not None:
@@ -571,16 +808,13 @@ class WordMaze(Maze):
                 if unexplored_blocks_around:
                     direction, to_block = random.choice(unexplored_blocks_around)
                     if direction not in block.exit_directions:
-                        block.exit_directions.add(direction)
-                        to_block.entry_direction = GridDirection.get_opposite_direction(direction)
+                        self.map.connect(block, direction)
                         self.generate_paths(to_block)
 
             all_explored_blocks = self.map.get_all_explored_blocks()
             all_explored_end_path_blocks = [block for block in all_explored_blocks if len(block.exit_directions) == 0]
             new_end_count = len(all_explored_end_path_blocks)
 
-        self.map.clean_all_blocks()
-
     def apply_letters_to_junctions(self) -> None:
         for block in self.map.get_all_junctions(ignore_cache=True):
             self.place_letter_in_exit_blocks(block)
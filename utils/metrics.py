@@ -0,0 +1,161 @@
+from contextlib import contextmanager
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+# Seconds, sized for mazes that take anywhere from a blink to a couple of minutes
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+def format_labels(label_names: Tuple[str, ...], label_values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = []
+    for name, value in zip(label_names, label_values):
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        pairs.append(f"{name}=\"{value}\"")
+    if extra:
+        pairs.append(extra)
+
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    metric_type = "untyped"
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}.")
+
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+
+        return [f"{self.name}{format_labels(self.label_names, key)} {format_value(value)}" for key, value in values.items()]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self.samples())
+
+        return "\n".join(lines)
+
+class Counter(Metric):
+    metric_type = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = (), callback: Callable[[], float] = None):
+        super().__init__(name, help_text, label_names)
+        # An unlabelled counter can instead be read from a callback, e.g. an existing running total
+        self.callback = callback
+        # Unlabelled counters report 0 before their first increment
+        if not self.label_names:
+            self._values[()] = 0
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        if self.callback:
+            return [f"{self.name} {format_value(self.callback())}"]
+
+        return super().samples()
+
+class Gauge(Metric):
+    metric_type = "gauge"
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = (), callback: Callable[[], float] = None):
+        super().__init__(name, help_text, label_names)
+        # An unlabelled gauge can instead be read from a callback every time it is scraped
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_in_progress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self) -> List[str]:
+        if self.callback:
+            return [f"{self.name} {format_value(self.callback())}"]
+
+        return super().samples()
+
+class Histogram(Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            if key not in self._values:
+                # Per bucket counts, then the running sum
+                self._values[key] = [[0] * len(self.buckets), 0.0]
+            bucket_counts, _ = self._values[key]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    bucket_counts[index] += 1
+            self._values[key][1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = {key: (list(bucket_counts), total) for key, (bucket_counts, total) in self._values.items()}
+
+        lines = []
+        for key, (bucket_counts, total) in values.items():
+            for bound, count in zip(self.buckets, bucket_counts):
+                bound_label = 'le="' + format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{format_labels(self.label_names, key, bound_label)} {count}")
+            lines.append(f"{self.name}_sum{format_labels(self.label_names, key)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.label_names, key)} {bucket_counts[-1]}")
+
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All registered metrics in the Prometheus text exposition format"""
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
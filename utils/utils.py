@@ -16,4 +16,20 @@ class GridDirection(Enum):
         if direction == cls.North:
             return cls.South
         if direction == cls.South:
-            return cls.North
\ No newline at end of file
+            return cls.North
+
+# Bit used for each direction when a block's openings are packed into an int
+DIRECTION_BITS = {
+    GridDirection.North: 1,
+    GridDirection.East: 2,
+    GridDirection.South: 4,
+    GridDirection.West: 8,
+}
+
+# Change in grid (x, y) when stepping in each direction
+DIRECTION_OFFSETS = {
+    GridDirection.North: (0, -1),
+    GridDirection.East: (1, 0),
+    GridDirection.South: (0, 1),
+    GridDirection.West: (-1, 0),
+}
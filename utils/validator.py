@@ -0,0 +1,126 @@
+from typing import List, Tuple
+import numpy as np
+
+from utils.map import Maze, WordMaze
+from utils.utils import DIRECTION_BITS, DIRECTION_OFFSETS, GridDirection
+
+# Number of set bits for every 4 bit direction mask
+EXIT_COUNTS = np.array([bin(bits).count("1") for bits in range(16)], dtype=np.uint8)
+
+class ValidationFailure:
+    def __init__(self, check: str, message: str, cells: List[Tuple[int, int]] = None):
+        self.check = check
+        self.message = message
+        self.cells = cells if cells else []
+
+    def __repr__(self) -> str:
+        return f"ValidationFailure({self.check!r}, {self.message!r}, cells={self.cells!r})"
+
+def shift_to_neighbours(grid: np.ndarray, direction: GridDirection, fill) -> np.ndarray:
+    """Return an array holding, at every [y, x], the value of its neighbour in direction"""
+    offset_x, offset_y = DIRECTION_OFFSETS[direction]
+    height, width = grid.shape
+    padded = np.pad(grid, 1, constant_values=fill)
+
+    return padded[1 + offset_y:1 + offset_y + height, 1 + offset_x:1 + offset_x + width]
+
+def cells_of(mask: np.ndarray) -> List[Tuple[int, int]]:
+    """(x, y) coordinates of every cell set in mask"""
+    return [(int(x), int(y)) for y, x in np.argwhere(mask)]
+
+def validate_maze(maze: Maze) -> List[ValidationFailure]:
+    """Check a finished maze in one pass over its grid state, returning every problem found.
+
+    Checks that each exit matches the neighbour's entry (and vice versa), the maze opens
+    North at the start and South at the end, no cycles exist, every explored block is
+    reachable from the start, and for a WordMaze that the solution path spells the word.
+    """
+    grid = maze.map
+    failures = []
+    exit_bits, entry_bits, explored, letters = grid.get_grid_state()
+    height, width = exit_bits.shape
+
+    start_x, start_y = grid.get_block_x_y_tuple(maze.map_start)
+    end_x, end_y = grid.get_block_x_y_tuple(maze.map_end)
+    start_index = start_y * width + start_x
+    end_index = end_y * width + end_x
+
+    # The start and end are the only blocks allowed to open off the grid
+    boundary_ok = np.zeros((height, width), dtype=np.uint8)
+    boundary_ok[start_y, start_x] |= DIRECTION_BITS[GridDirection.North]
+    boundary_ok[end_y, end_x] |= DIRECTION_BITS[GridDirection.South]
+
+    if entry_bits[start_y, start_x] != DIRECTION_BITS[GridDirection.North]:
+        failures.append(ValidationFailure("open_boundary", "Start block is not entered from the North.", [(start_x, start_y)]))
+    if not exit_bits[end_y, end_x] & DIRECTION_BITS[GridDirection.South]:
+        failures.append(ValidationFailure("open_boundary", "End block does not exit to the South.", [(end_x, end_y)]))
+
+    both = (entry_bits & exit_bits) != 0
+    if both.any():
+        failures.append(ValidationFailure("relationships", "Block exits through its own entry.", cells_of(both)))
+
+    # Each block's parent is the neighbour it is entered from, if that neighbour exits back to it
+    indexes = np.arange(height * width).reshape((height, width))
+    parents = indexes.copy()
+    in_bounds_grid = np.ones((height, width), dtype=bool)
+
+    for direction in GridDirection:
+        bit = DIRECTION_BITS[direction]
+        opposite_bit = DIRECTION_BITS[GridDirection.get_opposite_direction(direction)]
+        in_bounds = shift_to_neighbours(in_bounds_grid, direction, False)
+        neighbour_entry = shift_to_neighbours(entry_bits, direction, 0)
+        neighbour_exit = shift_to_neighbours(exit_bits, direction, 0)
+
+        exits = (exit_bits & bit) != 0
+        entries = entry_bits == bit
+
+        dangling_exits = exits & in_bounds & (neighbour_entry != opposite_bit)
+        if dangling_exits.any():
+            failures.append(ValidationFailure("relationships", f"{direction.value} exit does not match the neighbour's entry.", cells_of(dangling_exits)))
+
+        connected = entries & in_bounds & ((neighbour_exit & opposite_bit) != 0)
+        dangling_entries = entries & in_bounds & ~connected
+        if dangling_entries.any():
+            failures.append(ValidationFailure("relationships", f"{direction.value} entry does not match the neighbour's exit.", cells_of(dangling_entries)))
+
+        off_grid = (exits | entries) & ~in_bounds & ((boundary_ok & bit) == 0)
+        if off_grid.any():
+            failures.append(ValidationFailure("open_boundary", f"Block opens {direction.value} off the edge of the grid.", cells_of(off_grid)))
+
+        parents[connected] = shift_to_neighbours(indexes, direction, 0)[connected]
+
+    # Pointer jumping finds every block's furthest ancestor in log(blocks) vectorized steps
+    parents = parents.ravel()
+    ancestors = parents.copy()
+    for _ in range(int(np.ceil(np.log2(max(height * width, 2)))) + 1):
+        ancestors = ancestors[ancestors]
+
+    rooted = parents[ancestors] == ancestors
+    if not rooted.all():
+        failures.append(ValidationFailure("cycles", "Blocks form a loop.", cells_of(~rooted.reshape((height, width)))))
+
+    reachable = (rooted & (ancestors == start_index)).reshape((height, width))
+    unreachable = explored & ~reachable & rooted.reshape((height, width))
+    if unreachable.any():
+        failures.append(ValidationFailure("reachability", "Explored blocks cannot be reached from the start.", cells_of(unreachable)))
+
+    unexplored = reachable & ~explored
+    if unexplored.any():
+        failures.append(ValidationFailure("reachability", "Unexplored blocks are connected to the maze.", cells_of(unexplored)))
+
+    if isinstance(maze, WordMaze) and reachable.ravel()[end_index]:
+        # Walk back up from the end to recover the solution path
+        path = [end_index]
+        while path[-1] != start_index:
+            path.append(parents[path[-1]])
+        path.reverse()
+
+        exit_counts = EXIT_COUNTS[exit_bits.ravel()]
+        flat_letters = letters.ravel()
+        spelled = "".join(flat_letters[next_index] for index, next_index in zip(path, path[1:]) if exit_counts[index] > 1)
+
+        if spelled != maze.word.lower():
+            junctions = [(int(index % width), int(index // width)) for index in path[:-1] if exit_counts[index] > 1]
+            failures.append(ValidationFailure("word", f"Solution path spells {spelled!r} instead of {maze.word.lower()!r}.", junctions))
+
+    return failures